@@ -0,0 +1,67 @@
+/* Compiled single-octave Perlin kernel, used by perlin.Perlin when Numba is
+   not available. Mirrors Perlin._octave; see perlin.py for the algorithm. */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+#include <stdint.h>
+
+static void octave_array(const float *xs, Py_ssize_t n, const uint8_t *perm,
+                         unsigned salt, int cubic, float *out)
+{
+    for (Py_ssize_t i = 0; i < n; i++) {
+        float x = xs[i];
+        float fx = floorf(x);
+        float t = x - fx;
+        unsigned i0 = ((unsigned)(int64_t)fx * salt) & 255;
+        float a = ((perm[i0] & 1) ? 1.0f : -1.0f) * t;
+        float b = ((perm[i0 + salt] & 1) ? 1.0f : -1.0f) * (t - 1);
+        float f = cubic ? t * t * (3 - 2 * t)
+                         : t * t * t * (t * (t * 6 - 15) + 10);
+        out[i] = a + f * (b - a);
+    }
+}
+
+static PyObject *py_octave_array(PyObject *self, PyObject *args)
+{
+    Py_buffer xs, perm, out;
+    unsigned salt;
+    int cubic;
+    PyObject *result = NULL;
+
+    if (!PyArg_ParseTuple(args, "y*y*Ipw*", &xs, &perm, &salt, &cubic, &out))
+        return NULL;
+    if (xs.len != out.len || xs.len % sizeof(float) != 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "xs and out must be float32 buffers of equal size");
+    } else if (perm.len != 512 || salt > 255) {
+        PyErr_SetString(PyExc_ValueError,
+                        "perm must hold 512 entries and salt be below 256");
+    } else {
+        Py_BEGIN_ALLOW_THREADS
+        octave_array(xs.buf, xs.len / sizeof(float), perm.buf, salt, cubic,
+                     out.buf);
+        Py_END_ALLOW_THREADS
+        Py_INCREF(Py_None);
+        result = Py_None;
+    }
+    PyBuffer_Release(&xs);
+    PyBuffer_Release(&perm);
+    PyBuffer_Release(&out);
+    return result;
+}
+
+static PyMethodDef methods[] = {
+    {"octave_array", py_octave_array, METH_VARARGS,
+     "octave_array(xs, perm, salt, cubic, out)\n"
+     "Write the single-octave noise value of each element of xs into out."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "_perlin", NULL, -1, methods
+};
+
+PyMODINIT_FUNC PyInit__perlin(void)
+{
+    return PyModule_Create(&module);
+}
@@ -1,11 +1,55 @@
 import math
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import _perlin
+except ImportError:
+    _perlin = None
+
+# Number of samples noise_array evaluates at a time without Numba
+BLOCK_SIZE = 1024
+
+if njit:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _noise_array_nb(xs, perm, amps, freqs, maxY, salt, cubic):
+        '''Compiled equivalent of Perlin.noise_array. Samples are independent,
+           so they are computed in parallel.'''
+        out = np.empty_like(xs)
+        for i in prange(xs.size):
+            x = xs[i]
+            y = 0.0
+            for k in range(amps.size):
+                xf = x*freqs[k]
+                x0 = int(math.floor(xf))
+                t = xf-x0
+                i0 = (x0*salt) & 255
+                h0 = perm[i0]
+                h1 = perm[i0+salt]
+                a = t if h0 & 1 else -t
+                b = t-1 if h1 & 1 else 1-t
+                if cubic:
+                    fade = t * t * (3 - 2 * t)
+                else:
+                    fade = t * t * t * (t * (t * 6 - 15) + 10)
+                y += amps[k]*(a+fade*(b-a))
+            out[i] = y/maxY
+        return out
 
 class Perlin:
     '''Perlin noise generator, using the 2002 algorithm.
        Note that this implementation wraps around at 255.'''
-    def __init__(self, octaves=1, persistence=0.5, salt=1):
+    def __init__(self, octaves=1, persistence=0.5, salt=1, fade_kind='quintic'):
         # PRNG salt. Should probably be either 1 or a prime; definitely not 0.
-        self._salt = salt
+        # Only the low byte affects the hash, so reduce it up front to avoid
+        # bigint arithmetic in the scalar path. The int32 products in the
+        # vectorized paths can still wrap around for large x, which is
+        # harmless since wraparound preserves the low byte.
+        self._salt = salt & 255
 
         # How many octaves do we use?
         self._octaves = octaves
@@ -13,8 +57,25 @@ class Perlin:
         # Relative scale of octaves with higher frequency
         self._persistence = persistence
 
+        # Per-octave amplitudes and frequencies, and the sum of amplitudes
+        # used to normalize the result
+        self._amps = [persistence**k for k in range(octaves)]
+        self._freqs = [2**k for k in range(octaves)]
+        self._maxY = sum(self._amps)
+        self._amps_np = np.array(self._amps, dtype=np.float32)
+        self._freqs_np = np.array(self._freqs, dtype=np.float32)
+
+        # Fade curve; 'cubic' is cheaper, 'quintic' is smoother
+        if fade_kind == 'quintic':
+            self._fade = self._fade_quintic
+        elif fade_kind == 'cubic':
+            self._fade = self._fade_cubic
+        else:
+            raise ValueError("fade_kind must be 'quintic' or 'cubic'")
+        self._cubic = fade_kind == 'cubic'
+
         # More or less arbitrary lookup table
-        self._perm = [151,160,137,91,90,15,
+        perm = [151,160,137,91,90,15,
            131,13,201,95,96,53,194,233,7,225,140,36,103,30,69,142,8,99,37,240,21,10,23,
            190, 6,148,247,120,234,75,0,26,197,62,94,252,219,203,117,35,11,32,57,177,33,
            88,237,149,56,87,174,20,125,136,171,168, 68,175,74,165,71,134,139,48,27,166,
@@ -26,38 +87,122 @@ class Perlin:
            129,22,39,253, 19,98,108,110,79,113,224,232,178,185, 112,104,218,246,97,228,
            251,34,242,193,238,210,144,12,191,179,162,241, 81,51,145,235,249,14,239,107,
            49,192,214, 31,181,199,106,157,184, 84,204,176,115,121,50,45,127, 4,150,254,
-           138,236,205,93,222,114,67,29,24,72,243,141,128,195,78,66,215,61,156,180,
-           151]
+           138,236,205,93,222,114,67,29,24,72,243,141,128,195,78,66,215,61,156,180]
+
+        # Repeat the table, so that perm[i + salt], the hash of x0+1, never
+        # needs masking since both i and salt are in [0, 255].
+        # Stored as bytes, which is compact and cheap to index; it is
+        # immutable, so build a new generator to change it.
+        self._perm = bytes(perm + perm)
+
+        # The same table as a NumPy array, for vectorized lookups
+        self._perm_np = np.frombuffer(self._perm, dtype=np.uint8)
+
+        # With a single octave, skip the octave loop and normalization
+        if octaves == 1:
+            self.noise = self._noise1
+
+    @property
+    def perm(self):
+        '''The wrap-around permutation table, as 512 bytes.'''
+        return self._perm
+
+    @property
+    def salt(self):
+        '''The PRNG salt, reduced to [0, 255].'''
+        return self._salt
 
     def noise(self, x):
         '''Returns a noise value between -0.5 and 0.5.'''
+        # This is _octave, _grad, _fade and _lerp inlined into one loop,
+        # since function calls dominate the cost of the pure Python path.
+        perm = self._perm
+        salt = self._salt
+        cubic = self._cubic
+        floor = math.floor
         y = 0
-        maxY = 0
-        amp = 1
-        freq = 1
-        for octave in range(0, self._octaves):
-            y += amp*self._octave(x*freq)
-            maxY += amp
-            freq *= 2
-            amp *= self._persistence
-        return y/maxY
+        for amp, freq in zip(self._amps, self._freqs):
+            xf = x*freq
+            x0 = floor(xf)
+            t = xf-x0
+            i0 = (x0*salt) & 255
+            a = t if perm[i0] & 1 else -t
+            b = t-1 if perm[i0+salt] & 1 else 1-t
+            if cubic:
+                fade = t * t * (3 - 2 * t)
+            else:
+                fade = t * t * t * (t * (t * 6 - 15) + 10)
+            y += amp*(a+fade*(b-a))
+        return y/self._maxY
+
+    def _noise1(self, x):
+        '''noise, specialized for a single octave.'''
+        return self._octave(x)
+
+    def noise_array(self, xs):
+        '''Like noise, but computes noise values for a whole array of
+           x coordinates at once. Computations are done in single precision,
+           which is plenty for screen coordinates.'''
+        xs = np.asarray(xs, dtype=np.float32)
+        if njit:
+            ys = _noise_array_nb(xs.ravel(), self._perm_np, self._amps_np,
+                                 self._freqs_np, self._maxY, self._salt,
+                                 self._cubic)
+            return ys.reshape(xs.shape)
+        # Evaluate all octaves one block at a time, to keep intermediate
+        # arrays in cache.
+        flat = xs.ravel()
+        out = np.empty_like(flat)
+        octs = np.empty((self._octaves, min(flat.size, BLOCK_SIZE)),
+                        dtype=np.float32)
+        for start in range(0, flat.size, BLOCK_SIZE):
+            xb = flat[start:start+BLOCK_SIZE]
+            ob = octs[:, :xb.size]
+            for k, freq in enumerate(self._freqs):
+                ob[k] = self._octave_array(xb*freq)
+            out[start:start+BLOCK_SIZE] = self._amps_np @ ob
+        return (out / self._maxY).reshape(xs.shape)
 
     def _lerp(self, a, b, t):
         '''Linear interpolation between two values.'''
         return a+t*(b-a)
 
-    def _fade(self, t):
+    def _fade_quintic(self, t):
         '''Attenuate value, for smoother curves.'''
         return t * t * t * (t * (t * 6 - 15) + 10)
 
+    def _fade_cubic(self, t):
+        '''Cheaper version of _fade_quintic; the curve has a continuous slope,
+           but not a continuous curvature.'''
+        return t * t * (3 - 2 * t)
+
     def _octave(self, x):
         '''Generate noise for a single octave.'''
         x0 = math.floor(x)
-        x1 = x0 + 1
-        a = self._grad(self._perm[(x0*self._salt) & 255], x-x0)
-        b = self._grad(self._perm[(x1*self._salt) & 255], x-x1)
+        i0 = (x0*self._salt) & 255
+        a = self._grad(self._perm[i0], x-x0)
+        b = self._grad(self._perm[i0+self._salt], x-x0-1)
         return self._lerp(a, b, self._fade(x-x0))
 
+    def _octave_array(self, xs):
+        '''Vectorized version of _octave.'''
+        if _perlin:
+            xs = np.ascontiguousarray(xs, dtype=np.float32)
+            out = np.empty_like(xs)
+            _perlin.octave_array(xs, self._perm, self._salt, self._cubic, out)
+            return out
+        fx = np.floor(xs)
+        x0 = fx.astype(np.int32)
+        t = xs-fx
+        i0 = (x0*self._salt) & 255
+        a = self._grad_array(self._perm_np[i0], t)
+        b = self._grad_array(self._perm_np[i0+self._salt], t-1)
+        return self._lerp(a, b, self._fade(t))
+
+    def _grad_array(self, hashes, xs):
+        '''Vectorized version of _grad.'''
+        return ((hashes & 1).astype(np.float32)*2 - 1)*xs
+
     def _grad(self, hash, x):
         '''One-dimensional gradient vector at the given point.'''
         if hash & 1:
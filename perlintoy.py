@@ -1,5 +1,8 @@
 #!/usr/bin/python3
 import argparse
+import collections
+import math
+import numpy as np
 import pygame
 import pygame.draw
 import pygame.event
@@ -8,11 +11,110 @@ import pygame.key
 import pygame.time
 import perlin
 
+try:
+    import moderngl
+except ImportError:
+    moderngl = None
+
 DEFAULT_WIDTH = 800
 DEFAULT_HEIGHT = 600
 DEFAULT_PAN_SPEED = 500
 DEFAULT_SCALE = 1
 PAN_EPSILON = 0.0001
+TEXT_CACHE_SIZE = 32
+CUBIC_FADE_MAX_OCTAVES = 4
+# Events after which the window contents must be redrawn; the WINDOW*
+# events only exist in pygame 2
+REDRAW_EVENTS = {getattr(pygame, name) for name in
+                 ('VIDEOEXPOSE', 'WINDOWEXPOSED', 'WINDOWRESTORED', 'WINDOWSHOWN')
+                 if hasattr(pygame, name)}
+
+# Draws a fullscreen quad; the fragment shaders do the actual work
+GL_VERTEX_SHADER = '''
+#version 330
+in vec2 pos;
+void main() {
+    gl_Position = vec4(pos, 0.0, 1.0);
+}
+'''
+
+# Mirrors Perlin.noise, and draws the same polyline as PerlinRenderer
+GL_NOISE_SHADER = '''
+#version 330
+uniform sampler2D perm;
+uniform float offset;
+uniform float scale;
+uniform float width;
+uniform float height;
+uniform int octaves;
+uniform float persistence;
+uniform int salt;
+uniform bool cubic;
+out vec4 color;
+
+int hash(int i) {
+    return int(texelFetch(perm, ivec2(i, 0), 0).r*255.0 + 0.5);
+}
+
+float octave(float x) {
+    float x0 = floor(x);
+    float t = x-x0;
+    int i0 = (int(x0)*salt) & 255;
+    float a = (hash(i0) & 1) != 0 ? t : -t;
+    float b = (hash(i0+salt) & 1) != 0 ? t-1.0 : 1.0-t;
+    float fade = cubic ? t*t*(3.0-2.0*t) : t*t*t*(t*(t*6.0-15.0)+10.0);
+    return a+fade*(b-a);
+}
+
+float screenY(float px) {
+    float x = (px+offset)/scale;
+    float y = 0.0;
+    float maxY = 0.0;
+    float amp = 1.0;
+    float freq = 1.0;
+    for (int k = 0; k < octaves; k++) {
+        y += amp*octave(x*freq);
+        maxY += amp;
+        freq *= 2.0;
+        amp *= persistence;
+    }
+    return floor((y/maxY)*height/2.0 + height/2.0);
+}
+
+void main() {
+    float px = floor(gl_FragCoord.x);
+    float row = floor(height-gl_FragCoord.y);
+    // Cover the same rows as pygame.draw.lines does: of a segment rising
+    // or falling by d rows, the left column gets the first |d|/2 rows
+    // (rounded down) past its own y, and the right column the rest.
+    float y = screenY(px);
+    float lo = y;
+    float hi = y;
+    if (px < width-1.0) {
+        float e = y+trunc((screenY(px+1.0)-y)/2.0);
+        lo = min(lo, e);
+        hi = max(hi, e);
+    }
+    if (px > 0.0) {
+        float d = y-screenY(px-1.0);
+        float e = y-sign(d)*max(ceil(abs(d)/2.0)-1.0, 0.0);
+        lo = min(lo, e);
+        hi = max(hi, e);
+    }
+    bool onLine = row >= lo && row <= hi;
+    color = onLine ? vec4(0.0, 0.0, 0.0, 1.0) : vec4(1.0, 1.0, 1.0, 1.0);
+}
+'''
+
+# Blends a pygame surface, uploaded as a texture, on top of the noise
+GL_OVERLAY_SHADER = '''
+#version 330
+uniform sampler2D overlay;
+out vec4 color;
+void main() {
+    color = texelFetch(overlay, ivec2(gl_FragCoord.xy), 0);
+}
+'''
 
 class PerlinRenderer:
     '''Keeps track of Perlin noise settings and rendering.'''
@@ -22,7 +124,11 @@ class PerlinRenderer:
         self._scale = scale
         self._octaves = octaves
         self._persistence = persistence
-        self._gen = perlin.Perlin(self.octaves, self.persistence)
+        # Noise samples for the currently visible pixel columns, and the
+        # column they start at; None when they need to be recomputed.
+        self._ring = np.empty(width, dtype=np.float32)
+        self._ring_base_x = None
+        self._reloadGen()
 
     @property
     def scale(self): return self._scale
@@ -34,8 +140,16 @@ class PerlinRenderer:
     def persistence(self): return self._persistence
 
     def _reloadGen(self):
-        '''Recreate the noise generator with the current parameters.'''
-        self._gen = perlin.Perlin(self.octaves, self.persistence)
+        '''Recreate the noise generator with the current parameters.
+           The cheaper cubic fade is used unless there are many octaves.'''
+        if self.octaves <= CUBIC_FADE_MAX_OCTAVES:
+            fade_kind = 'cubic'
+        else:
+            fade_kind = 'quintic'
+        self._fade_kind = fade_kind
+        self._gen = perlin.Perlin(self.octaves, self.persistence,
+                                  fade_kind = fade_kind)
+        self._ring_base_x = None
           
     def modifyOctaves(self, diff):
         '''Add diff to the number of octaves of the generator, then reload it.'''
@@ -50,22 +164,126 @@ class PerlinRenderer:
     def modifyXScale(self, diff):
         '''Add diff to the horizontal rendering scale.'''
         self._scale += diff
+        self._ring_base_x = None
+
+    def _samples(self, x_start):
+        '''Noise values for the pixel columns starting at x_start. When
+           panning, only the columns that scrolled into view are computed.'''
+        scale = 10*self._scale
+        width = self._width
+        ring = self._ring
+        if self._ring_base_x is None or abs(x_start-self._ring_base_x) >= width:
+            xs = (np.arange(width)+x_start)/scale
+            ring[:] = self._gen.noise_array(xs)
+        else:
+            shift = x_start - self._ring_base_x
+            if shift > 0:
+                ring[:-shift] = ring[shift:]
+                xs = (np.arange(width-shift, width)+x_start)/scale
+                ring[-shift:] = self._gen.noise_array(xs)
+            elif shift < 0:
+                ring[-shift:] = ring[:shift]
+                xs = (np.arange(0, -shift)+x_start)/scale
+                ring[:-shift] = self._gen.noise_array(xs)
+        self._ring_base_x = x_start
+        return ring
 
     def render(self, screen, offset):
-        '''Render noise to the screen according to current settings, starting
-           from the give offset.'''
-        y0 = self._height/2
+        '''Clear the screen, then render noise to it according to current
+           settings, starting from the give offset.'''
+        screen.fill((255, 255, 255))
         halfHeight = self._height/2
-        scale = 10*self._scale
-        for x in range(0,self._width):
-            y = self._gen.noise((x+offset)/scale)*halfHeight+halfHeight
-            pygame.draw.line(screen, (0,0,0), (x, y0), (x+1, y))
-            y0 = y
+        ys = self._samples(math.floor(offset))*halfHeight+halfHeight
+        points = np.column_stack([np.arange(self._width), ys.astype(np.int32)])
+        pygame.draw.lines(screen, (0,0,0), False, points.tolist())
+
+    def present(self, screen, text, pos):
+        '''Render text on top of the noise, then show the rendered frame.'''
+        text.render(screen, pos)
+        pygame.display.flip()
+
+class GLPerlinRenderer(PerlinRenderer):
+    '''Renders Perlin noise with a fragment shader instead of on the CPU.
+       Requires the display to be in OpenGL mode; screen is then a
+       transparent surface holding the text, which is kept in a texture and
+       drawn on top of the noise.'''
+    def __init__(self, ctx, width, height, scale, octaves, persistence):
+        self._ctx = ctx
+        quad = np.array([-1, -1, 1, -1, -1, 1, 1, 1], dtype=np.float32)
+        vbo = ctx.buffer(quad.tobytes())
+        self._noiseProg = ctx.program(vertex_shader = GL_VERTEX_SHADER,
+                                      fragment_shader = GL_NOISE_SHADER)
+        self._noiseQuad = ctx.vertex_array(self._noiseProg, vbo, 'pos')
+        self._overlayProg = ctx.program(vertex_shader = GL_VERTEX_SHADER,
+                                        fragment_shader = GL_OVERLAY_SHADER)
+        self._overlayQuad = ctx.vertex_array(self._overlayProg, vbo, 'pos')
+        self._permTex = ctx.texture((512, 1), 1, dtype = 'f1')
+        self._overlayTex = ctx.texture((width, height), 4,
+                                       bytes(width*height*4))
+        # Lines of text currently in the overlay, with their screen areas
+        self._overlayLines = []
+        ctx.blend_func = moderngl.DEFAULT_BLENDING
+        self._noiseProg['perm'] = 0
+        self._overlayProg['overlay'] = 1
+        super().__init__(width, height, scale, octaves, persistence)
+
+    def _reloadGen(self):
+        '''Recreate the noise generator, then upload its permutation table.'''
+        super()._reloadGen()
+        self._permTex.write(self._gen.perm)
+
+    def render(self, screen, offset):
+        '''Render noise to the OpenGL framebuffer according to current
+           settings, starting from the given offset.'''
+        prog = self._noiseProg
+        prog['offset'] = math.floor(offset)
+        prog['scale'] = 10*self._scale
+        prog['width'] = self._width
+        prog['height'] = self._height
+        prog['octaves'] = self.octaves
+        prog['persistence'] = self.persistence
+        prog['salt'] = self._gen.salt
+        prog['cubic'] = self._fade_kind == 'cubic'
+        self._permTex.use(0)
+        self._ctx.disable(moderngl.BLEND)
+        self._noiseQuad.render(moderngl.TRIANGLE_STRIP)
+
+    def present(self, screen, text, pos):
+        '''Render text on top of the noise, then show the rendered frame.
+           screen still holds the previous frame's text, so only the lines
+           that changed since then are cleared and uploaded to the GPU.'''
+        lines = text.lines
+        old = self._overlayLines
+        dirty = [rect for i, (line, rect) in enumerate(old)
+                 if i >= len(lines) or lines[i] != line]
+        for rect in dirty:
+            screen.fill((0, 0, 0, 0), rect)
+        rects = text.render(screen, pos)
+        dirty += [rect for i, rect in enumerate(rects)
+                  if i >= len(old) or old[i][0] != lines[i]]
+        self._overlayLines = list(zip(lines, rects))
+        for rect in dirty:
+            self._uploadOverlay(screen, rect)
+        self._overlayTex.use(1)
+        self._ctx.enable(moderngl.BLEND)
+        self._overlayQuad.render(moderngl.TRIANGLE_STRIP)
+        pygame.display.flip()
+
+    def _uploadOverlay(self, screen, rect):
+        '''Copy the given area of screen into the overlay texture.'''
+        rect = rect.clip(screen.get_rect())
+        if rect.width and rect.height:
+            data = pygame.image.tostring(screen.subsurface(rect), 'RGBA', True)
+            viewport = (rect.x, self._height-rect.bottom, rect.width,
+                        rect.height)
+            self._overlayTex.write(data, viewport = viewport)
 
 class TextRenderer:
     '''Renders lines of text into the screen.'''
     def __init__(self, font = "Courier New", size = 20):
         self._text_lines = []
+        # Rendered surfaces of recently drawn lines, least recent first
+        self._cache = collections.OrderedDict()
         pygame.font.init()
         self._font = pygame.font.SysFont(font, size)
 
@@ -74,30 +292,58 @@ class TextRenderer:
            It will be rendered to screen during the next screen update.'''
         self._text_lines.append(text)
 
+    @property
+    def lines(self):
+        '''The lines of text queued for the next render.'''
+        return list(self._text_lines)
+
     def render(self, screen, pos):
         '''Render all queued lines of text to the screen, then clear the
-           text buffer.'''
+           text buffer. Returns the area covered by each line.'''
         (x, y) = pos
+        rects = []
         for line in self._text_lines:
-            surface = self._font.render(line, False, (0,0,0))
-            screen.blit(surface, (x, y))
+            surface = self._renderLine(line, screen)
+            rects.append(screen.blit(surface, (x, y)))
             y += 25
         self._text_lines = []
+        return rects
+
+    def _renderLine(self, line, screen):
+        '''Render a line of text to a surface in the same format as screen,
+           reusing the surface from a previous frame if the line has been
+           rendered recently.'''
+        surface = self._cache.get(line)
+        if surface is None:
+            surface = self._font.render(line, False, (0,0,0)).convert(screen)
+            self._cache[line] = surface
+            if len(self._cache) > TEXT_CACHE_SIZE:
+                self._cache.popitem(last = False)
+        else:
+            self._cache.move_to_end(line)
+        return surface
 
 class PerlinToy:
     def __init__(self,
                  width    = DEFAULT_WIDTH,
                  height   = DEFAULT_HEIGHT,
-                 panSpeed = DEFAULT_PAN_SPEED):
+                 panSpeed = DEFAULT_PAN_SPEED,
+                 gpu      = False):
         pygame.init()
         self._perlin = PerlinRenderer(width, height, 10, 2, 0.5)
         self._text = TextRenderer()
         self._done = False
         self._panSpeed = panSpeed
+        self._gpu = gpu
         self._lastPanTime = 0
         self._currentPanSpeed = 0
         self._isPanning = False
         self._offset = 0
+        # Settings shown by _printInfo, and the info lines built from them
+        self._infoSettings = None
+        self._infoLines = []
+        # Does the screen need to be redrawn?
+        self._dirty = True
         self._keyUpHandlers = {
             pygame.K_ESCAPE:   lambda: self._quit()
           , pygame.K_UP:       lambda: self._perlin.modifyOctaves(1)
@@ -126,11 +372,10 @@ class PerlinToy:
         self._lastPanTime = 0
 
     def _render(self, screen):
-        '''Clear the screen, then render the "scene".'''
-        screen.fill((255, 255, 255))
+        '''Render the "scene", then show it.'''
         self._perlin.render(screen, self._offset)
-        self._text.render(screen, (20, 20))
-        pygame.display.flip()
+        self._perlin.present(screen, self._text, (20, 20))
+        self._dirty = False
 
     def _pan(self):
         '''Pan the view by _panSpeed units per second.'''
@@ -143,6 +388,7 @@ class PerlinToy:
             if delta > 0:
                 self._offset += (self._currentPanSpeed * delta)/1000
                 self._lastPanTime = t
+                self._dirty = True
 
     def _handleEvents(self):
         '''Block until an event appears, then handle it.'''
@@ -155,32 +401,63 @@ class PerlinToy:
             try:
                 if event.type == pygame.KEYUP:
                     self._keyUpHandlers[event.key]()
+                    self._dirty = True
                 elif event.type == pygame.KEYDOWN:
                     self._keyDownHandlers[event.key]()
+                    self._dirty = True
+                elif event.type in REDRAW_EVENTS:
+                    self._dirty = True
             except KeyError:
                 pass
 
     def _printInfo(self):
-        '''Print usage instructions and settings to screen.'''
-        self._text.print("Escape: quit")
-        self._text.print("Up/down: more/fewer octaves")
-        self._text.print("PgUp/PgDn: raise/lower persistence by 0.1")
-        self._text.print("Home/end: increase/decrease horz. scale")
-        self._text.print("Left/right: pan left/right")
-        self._text.print("Octaves: " + str(self._perlin.octaves))
-        self._text.print("Persistence: " + str(self._perlin.persistence))
-        self._text.print("Horz. scale: " + str(self._perlin.scale))
+        '''Print usage instructions and settings to screen. The lines only
+           change with the settings, so they are rebuilt only then.'''
+        settings = (self._perlin.octaves,
+                    self._perlin.persistence,
+                    self._perlin.scale)
+        if settings != self._infoSettings:
+            self._infoSettings = settings
+            self._infoLines = [
+                "Escape: quit",
+                "Up/down: more/fewer octaves",
+                "PgUp/PgDn: raise/lower persistence by 0.1",
+                "Home/end: increase/decrease horz. scale",
+                "Left/right: pan left/right",
+                "Octaves: " + str(self._perlin.octaves),
+                "Persistence: " + str(self._perlin.persistence),
+                "Horz. scale: " + str(self._perlin.scale)
+            ]
+        for line in self._infoLines:
+            self._text.print(line)
         self._text.print("Pan offset: " + str(self._offset))
-        
+
     def go(self):
         '''Start application using default settings.'''
         self._done = False
-        screen = pygame.display.set_mode((self._width, self._height))
+        size = (self._width, self._height)
+        if self._gpu:
+            # The shaders need OpenGL 3.3, which some platforms (e.g. macOS)
+            # only provide as a core profile context
+            pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 3)
+            pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 3)
+            pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK,
+                                            pygame.GL_CONTEXT_PROFILE_CORE)
+            pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF)
+            old = self._perlin
+            ctx = moderngl.create_context(require = 330)
+            self._perlin = GLPerlinRenderer(ctx, self._width, self._height,
+                                            old.scale, old.octaves,
+                                            old.persistence)
+            screen = pygame.Surface(size, pygame.SRCALPHA)
+        else:
+            screen = pygame.display.set_mode(size)
         while not self._done:
-            self._printInfo()
             self._handleEvents()
             self._pan()
-            self._render(screen)
+            if self._dirty:
+                self._printInfo()
+                self._render(screen)
         pygame.display.quit()
         pygame.quit()
 
@@ -203,10 +480,16 @@ class PerlinToy:
                             metavar = 'N',
                             help = 'Horizontal pan speed',
                             type = int)
+        parser.add_argument('--gpu', '-g',
+                            action = 'store_true',
+                            help = 'Render noise on the GPU using OpenGL')
         result = parser.parse_args()
+        if result.gpu and not moderngl:
+            parser.error('--gpu requires the moderngl package')
         self._width = result.width
         self._height = result.height
         self._panSpeed = result.pan
+        self._gpu = result.gpu
         return self.go()
 
 if __name__ == "__main__":
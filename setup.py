@@ -0,0 +1,11 @@
+from setuptools import setup, Extension
+
+# Only used to build the optional native noise kernel in place:
+#   $ python3 setup.py build_ext --inplace
+setup(
+    name = 'perlintoy',
+    ext_modules = [
+        Extension('_perlin', ['_perlin.c'],
+                  extra_compile_args = ['-O3', '-march=native', '-ffast-math'])
+    ]
+)